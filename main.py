@@ -7,144 +7,579 @@ It checks canonical URLs and formats output with match status.
 """
 
 import argparse
-import requests
-import xml.etree.ElementTree as ET
+import asyncio
+import aiohttp
+from aiohttp_client_cache import CachedSession, SQLiteBackend
 from urllib.parse import urlparse, urljoin
-from bs4 import BeautifulSoup
-import time
+from urllib.robotparser import RobotFileParser
+from bs4 import BeautifulSoup, SoupStrainer
+import soupsieve
+from io import BytesIO
+from lxml import etree
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+import orjson
 import sys
-from typing import List, Dict, Optional
-from datetime import datetime
+from typing import List, Dict, Optional, Set, Tuple
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 import re
 import os
 
 
-def parse_sitemap(sitemap_url: str) -> List[str]:
+# Use more standard headers that are less likely to be blocked
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.5',
+    'Accept-Encoding': 'gzip, deflate, br, zstd',
+    'Connection': 'keep-alive',
+    'Upgrade-Insecure-Requests': '1',
+}
+
+# Seconds before a single request is abandoned
+REQUEST_TIMEOUT = 30
+
+# Retry policy for transient failures
+MAX_RETRIES = 3
+BACKOFF_FACTOR = 0.3
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Upper bound on how long a Retry-After header may pause a host
+MAX_RETRY_AFTER = 60
+
+# Seconds to keep resolved host addresses before looking them up again
+DNS_CACHE_TTL = 300
+
+# Seconds an idle pooled connection stays open on top of the request delay
+KEEPALIVE_TIMEOUT = 15
+
+# Responses are cached on disk so repeated runs don't refetch unchanged pages
+CACHE_NAME = 'output/.http_cache.sqlite'
+CACHE_EXPIRE_AFTER = 3600
+CACHE_ALLOWED_CODES = (200, 301, 302)
+
+SITEMAP_NAMESPACE = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+
+# Only the tags holding the metadata we read are added to the parse tree
+METADATA_STRAINER = SoupStrainer(['title', 'link', 'meta'])
+
+# CSS selectors for the metadata tags, compiled once
+CANONICAL_SELECTOR = soupsieve.compile('link[rel~="canonical"]')
+TITLE_SELECTOR = soupsieve.compile('title')
+DESCRIPTION_SELECTOR = soupsieve.compile('meta[name="description"]')
+
+# Patterns used to turn a domain into a safe filename
+WWW_PREFIX_RE = re.compile(r'^www\.')
+UNSAFE_FILENAME_CHARS_RE = re.compile(r'[^\w\-]')
+
+# Output is buffered and flushed to disk every CHECKPOINT_INTERVAL pages
+OUTPUT_BUFFER_SIZE = 1 << 20
+CHECKPOINT_INTERVAL = 50
+
+# Blank lines between pages in the text report, pre-encoded for the binary output file
+PAGE_SEPARATOR = b'\n\n'
+
+# Maximum number of fetched pages waiting to be parsed
+PARSE_QUEUE_SIZE = 32
+
+
+class HostRateLimiter:
     """
-    Parse XML sitemap and extract URLs.
+    Space out requests to each host by a minimum delay.
+    
+    Every host has its own lock, so requests to one host wait their turn
+    while requests to other hosts proceed in parallel.
+    """
+    
+    def __init__(self, delay: float):
+        """
+        Args:
+            delay: Minimum number of seconds between requests to the same host
+        """
+        self.delay = delay
+        self.host_delays: Dict[str, float] = {}
+        self.next_request_at: Dict[str, float] = {}
+        self.locks: Dict[str, asyncio.Lock] = {}
+    
+    async def wait(self, url: str) -> None:
+        """
+        Wait until a request to the URL's host is allowed and reserve the slot.
+        
+        Args:
+            url: URL about to be requested
+        """
+        host = urlparse(url).netloc
+        loop = asyncio.get_running_loop()
+        
+        async with self.locks.setdefault(host, asyncio.Lock()):
+            # Re-check after sleeping in case the host was paused meanwhile
+            while (remaining := self.next_request_at.get(host, 0.0) - loop.time()) > 0:
+                await asyncio.sleep(remaining)
+            self.next_request_at[host] = loop.time() + self.host_delays.get(host, self.delay)
+    
+    def set_delay(self, url: str, seconds: float) -> None:
+        """
+        Use a longer delay for the URL's host, e.g. a robots.txt Crawl-delay.
+        
+        Args:
+            url: URL whose host the delay applies to
+            seconds: Minimum number of seconds between requests to the host
+        """
+        host = urlparse(url).netloc
+        self.host_delays[host] = max(self.delay, seconds)
+    
+    def pause(self, url: str, seconds: float) -> None:
+        """
+        Hold back all requests to the URL's host for the given time.
+        
+        Args:
+            url: URL whose host should be paused
+            seconds: Number of seconds to pause for
+        """
+        host = urlparse(url).netloc
+        resume_at = asyncio.get_running_loop().time() + seconds
+        self.next_request_at[host] = max(self.next_request_at.get(host, 0.0), resume_at)
+
+
+def create_session(concurrency: int, limiter: HostRateLimiter, use_cache: bool) -> aiohttp.ClientSession:
+    """
+    Create the HTTP session shared by the sitemap and page requests.
     
     Args:
-        sitemap_url: URL to the sitemap XML file
+        concurrency: Maximum number of pooled connections
+        limiter: Per-host rate limiter whose delay sizes the keep-alive
+        use_cache: Whether to serve responses from the on-disk HTTP cache
+        
+    Returns:
+        Configured client session
+    """
+    # Keep idle connections open through the rate limiter's wait so the
+    # next request to the host reuses them instead of a new TCP+TLS handshake.
+    # This is sized from --delay only: robots.txt Crawl-delay is learned after
+    # the connector exists, so a host whose Crawl-delay exceeds
+    # KEEPALIVE_TIMEOUT + --delay reconnects for every request.
+    connector = aiohttp.TCPConnector(
+        limit=concurrency,
+        use_dns_cache=True,
+        ttl_dns_cache=DNS_CACHE_TTL,
+        keepalive_timeout=KEEPALIVE_TIMEOUT + limiter.delay,
+    )
+    
+    if not use_cache:
+        return aiohttp.ClientSession(connector=connector, headers=HEADERS)
+    
+    os.makedirs(os.path.dirname(CACHE_NAME), exist_ok=True)
+    cache = SQLiteBackend(
+        CACHE_NAME,
+        expire_after=CACHE_EXPIRE_AFTER,
+        allowed_codes=CACHE_ALLOWED_CODES,
+        cache_control=True,
+    )
+    return CachedSession(cache=cache, connector=connector, headers=HEADERS)
+
+
+async def wait_for_turn(session: aiohttp.ClientSession, limiter: HostRateLimiter, url: str,
+                        method: str = 'GET') -> None:
+    """
+    Wait on the rate limiter unless the response will come from the HTTP cache.
+    
+    Called before the request is made, so time spent waiting does not count
+    against the request timeout.
+    
+    Args:
+        session: Shared HTTP session the request will use
+        limiter: Per-host rate limiter to wait on
+        url: URL about to be requested
+        method: HTTP method of the request
+    """
+    if isinstance(session, CachedSession):
+        # get_response discards expired entries, so a hit here is served locally
+        key = session.cache.create_key(method, url)
+        if await session.cache.get_response(key):
+            return
+    
+    await limiter.wait(url)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Parse a Retry-After header into a number of seconds.
+    
+    Args:
+        value: Header value, either delay seconds or an HTTP date
         
     Returns:
-        List of URLs from the sitemap
+        Seconds to wait (capped at MAX_RETRY_AFTER), or None if absent or invalid
     """
+    if not value:
+        return None
+    
     try:
-        # Use more standard headers that are less likely to be blocked
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-            'Accept-Language': 'en-US,en;q=0.5',
-            'Accept-Encoding': 'gzip, deflate',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1',
-        }
+        seconds = float(value)
+    except ValueError:
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if retry_at.tzinfo is None:
+            retry_at = retry_at.replace(tzinfo=timezone.utc)
+        seconds = (retry_at - datetime.now(timezone.utc)).total_seconds()
+    
+    return min(max(seconds, 0.0), MAX_RETRY_AFTER)
+
+
+async def fetch(session: aiohttp.ClientSession, limiter: HostRateLimiter, url: str) -> bytes:
+    """
+    Fetch a URL, retrying connection errors and transient HTTP statuses.
+    
+    Args:
+        session: Shared HTTP session used for the request
+        limiter: Per-host rate limiter every attempt waits on
+        url: URL to fetch
         
-        response = requests.get(sitemap_url, headers=headers, timeout=30, allow_redirects=True)
-        response.raise_for_status()
+    Returns:
+        Raw response body
+    """
+    timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+    for attempt in range(MAX_RETRIES + 1):
+        last_attempt = attempt == MAX_RETRIES
+        retry_after = None
         
-        # Parse XML
-        root = ET.fromstring(response.content)
+        await wait_for_turn(session, limiter, url)
+        try:
+            async with session.get(url, timeout=timeout, allow_redirects=True) as response:
+                if response.status not in RETRY_STATUSES or last_attempt:
+                    response.raise_for_status()
+                    return await response.read()
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+            if last_attempt:
+                raise
         
-        # Handle different sitemap namespaces
-        namespaces = {
-            'sitemap': 'http://www.sitemaps.org/schemas/sitemap/0.9',
-            'news': 'http://www.google.com/schemas/sitemap-news/0.9',
-            'image': 'http://www.google.com/schemas/sitemap-image/1.1'
-        }
+        if retry_after is not None:
+            # Server told us when to come back; park the whole host until then
+            limiter.pause(url, retry_after)
+        else:
+            await asyncio.sleep(BACKOFF_FACTOR * (2 ** attempt))
+
+
+class RobotsRules:
+    """
+    Check URLs against each host's robots.txt.
+    
+    Every robots.txt is fetched once and reused for all URLs on that host.
+    A Crawl-delay directive raises the host's delay in the rate limiter.
+    """
+    
+    def __init__(self, session: aiohttp.ClientSession, limiter: HostRateLimiter):
+        """
+        Args:
+            session: Shared HTTP session used to fetch robots.txt
+            limiter: Per-host rate limiter that receives Crawl-delay values
+        """
+        self.session = session
+        self.limiter = limiter
+        self.parsers: Dict[str, asyncio.Task] = {}
+    
+    async def can_fetch(self, url: str) -> bool:
+        """
+        Check whether robots.txt allows the scraper to fetch a URL.
         
-        urls = []
+        Args:
+            url: URL about to be requested
+            
+        Returns:
+            True if the URL may be fetched, False otherwise
+        """
+        parsed_url = urlparse(url)
+        robots_url = f"{parsed_url.scheme}://{parsed_url.netloc}/robots.txt"
         
-        # Try different namespace approaches
-        for namespace in namespaces.values():
-            try:
-                url_elements = root.findall(f'.//{{{namespace}}}url')
-                if url_elements:
-                    for url_elem in url_elements:
-                        loc_elem = url_elem.find(f'{{{namespace}}}loc')
-                        if loc_elem is not None and loc_elem.text:
-                            urls.append(loc_elem.text.strip())
-                    break
-            except Exception:
-                continue
+        # Share a single download between concurrent lookups for the same host
+        if robots_url not in self.parsers:
+            self.parsers[robots_url] = asyncio.create_task(self.load(robots_url))
+        robots = await self.parsers[robots_url]
         
-        # Fallback: try without namespace
-        if not urls:
-            url_elements = root.findall('.//url')
-            for url_elem in url_elements:
-                loc_elem = url_elem.find('loc')
-                if loc_elem is not None and loc_elem.text:
-                    urls.append(loc_elem.text.strip())
+        return robots.can_fetch(HEADERS['User-Agent'], url)
+    
+    async def load(self, robots_url: str) -> RobotFileParser:
+        """
+        Download and parse a robots.txt file.
         
-        return urls
+        Follows RobotFileParser.read(): 401 and 403 disallow everything, other
+        errors (or a missing file) allow everything.
         
-    except requests.RequestException as e:
-        print(f"Error fetching sitemap: {e}")
-        print(f"Response status code: {getattr(e.response, 'status_code', 'N/A')}")
-        print(f"Response headers: {getattr(e.response, 'headers', 'N/A')}")
-        sys.exit(1)
-    except ET.ParseError as e:
-        print(f"Error parsing XML sitemap: {e}")
-        sys.exit(1)
+        Args:
+            robots_url: URL of the robots.txt file
+            
+        Returns:
+            Parsed robots.txt rules
+        """
+        robots = RobotFileParser(robots_url)
+        timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+        await wait_for_turn(self.session, self.limiter, robots_url)
+        try:
+            async with self.session.get(robots_url, timeout=timeout, allow_redirects=True) as response:
+                if response.status in (401, 403):
+                    robots.disallow_all = True
+                elif response.status >= 400:
+                    robots.allow_all = True
+                else:
+                    content = await response.read()
+                    robots.parse(content.decode('utf-8', errors='replace').splitlines())
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            robots.allow_all = True
+        
+        crawl_delay = robots.crawl_delay(HEADERS['User-Agent'])
+        if crawl_delay:
+            self.limiter.set_delay(robots_url, float(crawl_delay))
+        
+        return robots
 
 
-def extract_metadata(url: str) -> Dict[str, str]:
+def read_sitemap(content: bytes) -> Tuple[List[str], List[str]]:
     """
-    Extract metadata from a webpage.
+    Extract page and nested sitemap URLs from sitemap XML.
+    
+    Handles both <urlset> sitemaps and <sitemapindex> files, with or
+    without the sitemap namespace.
     
     Args:
-        url: URL of the page to scrape
+        content: Raw sitemap XML
         
     Returns:
-        Dictionary containing metadata
+        Tuple of page URLs and nested sitemap URLs
     """
-    try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-            'Accept-Language': 'en-US,en;q=0.5',
-            'Accept-Encoding': 'gzip, deflate',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1',
-        }
-        
-        response = requests.get(url, headers=headers, timeout=30, allow_redirects=True)
-        response.raise_for_status()
+    urls = []
+    sitemaps = []
+    
+    # Stream <url> and <sitemap> entries so large sitemaps are parsed in a
+    # single pass without building a tree
+    context = etree.iterparse(
+        BytesIO(content),
+        events=('end',),
+        tag=(
+            f'{{{SITEMAP_NAMESPACE}}}url', 'url',
+            f'{{{SITEMAP_NAMESPACE}}}sitemap', 'sitemap',
+        ),
+        resolve_entities=False,
+    )
+    for _, elem in context:
+        name = etree.QName(elem).localname
         
-        soup = BeautifulSoup(response.content, 'html.parser')
+        # Child <loc> shares the namespace of its parent
+        loc_elem = elem.find(elem.tag[:-len(name)] + 'loc')
+        if loc_elem is not None and loc_elem.text:
+            target = urls if name == 'url' else sitemaps
+            target.append(loc_elem.text.strip())
         
-        metadata = {
-            'url': url,
-            'canonical': '',
-            'title': '',
-            'description': ''
-        }
+        # Free processed elements to keep memory usage flat
+        elem.clear()
+        while elem.getprevious() is not None:
+            del elem.getparent()[0]
+    
+    return urls, sitemaps
+
+
+async def fetch_sitemap(session: aiohttp.ClientSession, limiter: HostRateLimiter,
+                        sitemap_url: str) -> Tuple[List[str], List[str]]:
+    """
+    Fetch and read a single sitemap file.
+    
+    Args:
+        session: Shared HTTP session used for the request
+        limiter: Per-host rate limiter for the request
+        sitemap_url: URL to the sitemap XML file
         
-        # Extract canonical URL
-        canonical = soup.find('link', rel='canonical')
-        if canonical and canonical.get('href'):
-            metadata['canonical'] = canonical['href']
+    Returns:
+        Tuple of page URLs and nested sitemap URLs
+    """
+    content = await fetch(session, limiter, sitemap_url)
+    return read_sitemap(content)
+
+
+async def parse_sitemap(session: aiohttp.ClientSession, limiter: HostRateLimiter,
+                        sitemap_url: str, page_count: int, concurrency: int) -> List[str]:
+    """
+    Parse XML sitemap and extract URLs.
+    
+    Sitemap indexes are expanded level by level, fetching the sitemaps of a
+    level concurrently. Expansion stops once enough URLs have been found to
+    cover page_count. Nested sitemaps that fail are reported and skipped.
+    
+    Args:
+        session: Shared HTTP session used for the requests
+        limiter: Per-host rate limiter for the requests
+        sitemap_url: URL to the sitemap XML file
+        page_count: Number of page URLs that will be scraped
+        concurrency: Maximum number of sitemaps fetched at once
         
-        # Extract title
-        title_tag = soup.find('title')
-        if title_tag:
-            metadata['title'] = title_tag.get_text().strip()
+    Returns:
+        List of page URLs from the sitemap and any nested sitemaps
+    """
+    try:
+        urls, level = await fetch_sitemap(session, limiter, sitemap_url)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        print(f"Error fetching sitemap: {e}")
+        print(f"Response status code: {getattr(e, 'status', 'N/A')}")
+        print(f"Response headers: {getattr(e, 'headers', 'N/A')}")
+        sys.exit(1)
+    except etree.XMLSyntaxError as e:
+        print(f"Error parsing XML sitemap: {e}")
+        sys.exit(1)
+    
+    seen = {sitemap_url, *level}
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def fetch_nested(url: str) -> Tuple[List[str], List[str]]:
+        async with semaphore:
+            return await fetch_sitemap(session, limiter, url)
+    
+    while level and len(urls) < page_count:
+        print(f"Fetching {len(level)} nested sitemaps...")
+        results = await asyncio.gather(
+            *(fetch_nested(url) for url in level),
+            return_exceptions=True,
+        )
         
-        # Extract description
-        desc_tag = soup.find('meta', attrs={'name': 'description'})
-        if desc_tag and desc_tag.get('content'):
-            metadata['description'] = desc_tag['content'].strip()
+        next_level = []
+        for nested_url, result in zip(level, results):
+            if isinstance(result, (aiohttp.ClientError, asyncio.TimeoutError, etree.XMLSyntaxError)):
+                print(f"Error reading sitemap {nested_url}: {result}")
+                continue
+            if isinstance(result, BaseException):
+                raise result
+            
+            page_urls, nested_sitemaps = result
+            urls.extend(page_urls)
+            for nested in nested_sitemaps:
+                if nested not in seen:
+                    seen.add(nested)
+                    next_level.append(nested)
         
-        return metadata
+        level = next_level
+    
+    return urls
+
+
+async def fetch_page(session: aiohttp.ClientSession, limiter: HostRateLimiter,
+                     url: str) -> Optional[bytes]:
+    """
+    Fetch the HTML of a webpage.
+    
+    Args:
+        session: Shared HTTP session used for the request
+        limiter: Per-host rate limiter for the request
+        url: URL of the page to scrape
         
-    except requests.RequestException as e:
+    Returns:
+        Raw page content, or None if the page could not be fetched
+    """
+    try:
+        return await fetch(session, limiter, url)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
         print(f"Error fetching {url}: {e}")
+        return None
+
+
+async def fetch_canonical_header(session: aiohttp.ClientSession, limiter: HostRateLimiter,
+                                 url: str) -> str:
+    """
+    Look up a page's canonical URL from its Link header with a HEAD request.
+    
+    Args:
+        session: Shared HTTP session used for the request
+        limiter: Per-host rate limiter for the request
+        url: URL of the page to check
+        
+    Returns:
+        Canonical URL, or an empty string if the header is missing or the request failed
+    """
+    timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+    await wait_for_turn(session, limiter, url, method='HEAD')
+    try:
+        async with session.head(url, timeout=timeout, allow_redirects=True) as response:
+            canonical = response.links.get('canonical')
+            if response.ok and canonical:
+                return str(canonical['url'])
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        pass
+    
+    return ''
+
+
+def extract_metadata(url: str, html: Optional[bytes]) -> Dict[str, str]:
+    """
+    Extract metadata from a webpage.
+    
+    Runs in a worker process, so it has to stay a module-level function.
+    
+    Args:
+        url: URL of the page
+        html: Raw page content, or None if the page could not be fetched
+        
+    Returns:
+        Dictionary containing metadata
+    """
+    if html is None:
         return {
             'url': url,
             'canonical': '',
             'title': 'ERROR: Could not fetch page',
             'description': ''
         }
+    
+    soup = BeautifulSoup(html, 'lxml', parse_only=METADATA_STRAINER)
+    
+    metadata = {
+        'url': url,
+        'canonical': '',
+        'title': '',
+        'description': ''
+    }
+    
+    # Extract canonical URL
+    canonical = CANONICAL_SELECTOR.select_one(soup)
+    if canonical and canonical.get('href'):
+        metadata['canonical'] = canonical['href']
+    
+    # Extract title
+    title_tag = TITLE_SELECTOR.select_one(soup)
+    if title_tag:
+        metadata['title'] = title_tag.get_text().strip()
+    
+    # Extract description
+    desc_tag = DESCRIPTION_SELECTOR.select_one(soup)
+    if desc_tag and desc_tag.get('content'):
+        metadata['description'] = desc_tag['content'].strip()
+    
+    return metadata
+
+
+def get_netloc(url: str) -> str:
+    """
+    Get the lowercased network location (host and port) of a URL.
+    
+    Uses plain string partitioning instead of urlparse since this runs
+    for every scraped page.
+    
+    Args:
+        url: Absolute or protocol-relative URL
+        
+    Returns:
+        Network location, or an empty string for relative URLs
+    """
+    prefix, separator, netloc = url.partition('//')
+    if not separator:
+        return ''
+    # '//' only starts the host at the very beginning or right after the
+    # scheme; anywhere else it is part of a relative path or query
+    if prefix and (not prefix.endswith(':') or any(c in prefix for c in '/?#')):
+        return ''
+    for delimiter in '/?#':
+        netloc = netloc.partition(delimiter)[0]
+    return netloc.lower()
 
 
 def check_canonical_match(url: str, canonical: str) -> bool:
@@ -158,16 +593,7 @@ def check_canonical_match(url: str, canonical: str) -> bool:
     Returns:
         True if domains match, False otherwise
     """
-    if not canonical:
-        return False
-    
-    try:
-        original_domain = urlparse(url).netloc
-        canonical_domain = urlparse(canonical).netloc
-        
-        return original_domain == canonical_domain
-    except Exception:
-        return False
+    return bool(canonical) and get_netloc(url) == get_netloc(canonical)
 
 
 def format_output(metadata: Dict[str, str]) -> str:
@@ -186,29 +612,58 @@ def format_output(metadata: Dict[str, str]) -> str:
     description = metadata['description']
     
     # Check if canonical matches
-    match_status = "✓" if check_canonical_match(url, canonical) else "FAIL"
+    matches = check_canonical_match(url, canonical)
+    match_status = "✓" if matches else "FAIL"
     
     # Print warning to console if canonical doesn't match
-    if not check_canonical_match(url, canonical):
+    if not matches:
         print(f"!!! CANONICAL DID NOT MATCH - {url}")
     
-    # Format output
-    output = f"{url}\n"
-    output += "=" * len(url) + "\n"
-    output += f"match {match_status}\n"
-    output += f"canonical: {canonical}\n"
-    output += f"title: {title}\n"
-    output += f"desc: {description}\n"
+    # Format output in a single string build
+    return (
+        f"{url}\n"
+        f"{'=' * len(url)}\n"
+        f"match {match_status}\n"
+        f"canonical: {canonical}\n"
+        f"title: {title}\n"
+        f"desc: {description}\n"
+    )
+
+
+def format_json_line(metadata: Dict[str, str]) -> bytes:
+    """
+    Format metadata as a single JSON Lines record.
+    
+    Args:
+        metadata: Dictionary containing page metadata
+        
+    Returns:
+        UTF-8 encoded JSON object followed by a newline
+    """
+    url = metadata['url']
+    matches = check_canonical_match(url, metadata['canonical'])
+    
+    # Print warning to console if canonical doesn't match
+    if not matches:
+        print(f"!!! CANONICAL DID NOT MATCH - {url}")
     
-    return output
+    record = {
+        'url': url,
+        'canonical': metadata['canonical'],
+        'match': matches,
+        'title': metadata['title'],
+        'desc': metadata['description'],
+    }
+    return orjson.dumps(record, option=orjson.OPT_APPEND_NEWLINE)
 
 
-def generate_filename(sitemap_url: str) -> str:
+def generate_filename(sitemap_url: str, extension: str = 'txt') -> str:
     """
     Generate filename with domain and timestamp.
     
     Args:
         sitemap_url: URL to extract domain from
+        extension: File extension for the output format
         
     Returns:
         Generated filename with output folder path
@@ -219,20 +674,309 @@ def generate_filename(sitemap_url: str) -> str:
         domain = parsed_url.netloc
         
         # Clean domain name (remove www. if present)
-        domain = re.sub(r'^www\.', '', domain)
+        domain = WWW_PREFIX_RE.sub('', domain)
         
         # Replace dots and other special characters with underscores
-        domain = re.sub(r'[^\w\-]', '_', domain)
+        domain = UNSAFE_FILENAME_CHARS_RE.sub('_', domain)
         
         # Generate timestamp
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         
-        return f"output/{domain}_metadata_check_{timestamp}.txt"
+        return f"output/{domain}_metadata_check_{timestamp}.{extension}"
         
     except Exception:
         # Fallback if domain extraction fails
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        return f"output/metadata_check_{timestamp}.txt"
+        return f"output/metadata_check_{timestamp}.{extension}"
+
+
+def get_progress_filename(output_filename: str) -> str:
+    """
+    Get the path of the progress file kept next to an output file.
+    
+    Args:
+        output_filename: Path of the output file
+        
+    Returns:
+        Path of the matching progress file
+    """
+    return f"{output_filename}.progress"
+
+
+def load_progress(output_filename: str) -> Set[str]:
+    """
+    Load the URLs an interrupted run already wrote to the output file.
+    
+    Args:
+        output_filename: Path of the output file being resumed
+        
+    Returns:
+        Set of completed URLs (empty if there is no progress file)
+    """
+    progress_filename = get_progress_filename(output_filename)
+    if not os.path.exists(progress_filename):
+        return set()
+    
+    with open(progress_filename, encoding='utf-8') as f:
+        return {line.rstrip('\n') for line in f if line.strip()}
+
+
+def write_checkpoint(output_file, progress_file, completed: List[str]) -> None:
+    """
+    Flush buffered output to disk, then record the pages it contains.
+    
+    The output is flushed first so the progress file never lists a page
+    that is not in the output yet.
+    
+    Args:
+        output_file: Open output file
+        progress_file: Open progress file
+        completed: URLs written since the last checkpoint (cleared afterwards)
+    """
+    output_file.flush()
+    progress_file.writelines(f"{url}\n" for url in completed)
+    progress_file.flush()
+    completed.clear()
+
+
+async def write_results(queue: asyncio.Queue, output_filename: str, append: bool,
+                        output_format: str) -> None:
+    """
+    Consume scraped metadata from the queue and write it to the output file.
+    
+    Runs as a single task so file writes stay sequential while pages are
+    fetched concurrently. Pages that finish early are held back so the
+    output follows the order of the URL list; if the run stops before a gap
+    is filled, the held-back pages are written after it. Stops when it
+    receives None.
+    
+    Args:
+        queue: Queue of (position, metadata) tuples, positions starting at 1, terminated by None
+        output_filename: Path of the file to write results to
+        append: Whether to add to the results of an interrupted run
+        output_format: 'text' for the readable report or 'jsonl' for JSON Lines
+    """
+    mode = 'a' if append else 'w'
+    json_lines = output_format == 'jsonl'
+    
+    # Write pre-encoded bytes straight to a buffered binary file, skipping
+    # the text layer's per-call encoding
+    with open(output_filename, mode + 'b', buffering=OUTPUT_BUFFER_SIZE) as f, \
+            open(get_progress_filename(output_filename), mode, encoding='utf-8') as progress:
+        needs_separator = f.tell() > 0
+        completed: List[str] = []
+        pending: Dict[int, Dict[str, str]] = {}
+        next_index = 1
+        
+        def write_page(metadata: Dict[str, str]) -> None:
+            nonlocal needs_separator
+            if json_lines:
+                f.write(format_json_line(metadata))
+            else:
+                # Add separator line between pages
+                page = format_output(metadata).encode('utf-8')
+                f.writelines((PAGE_SEPARATOR, page) if needs_separator else (page,))
+                needs_separator = True
+            completed.append(metadata['url'])
+        
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                
+                index, metadata = item
+                pending[index] = metadata
+                
+                # Write every page that is now next in line
+                while next_index in pending:
+                    write_page(pending.pop(next_index))
+                    next_index += 1
+                    
+                    # Periodically save to disk so an interrupted run can resume
+                    if len(completed) >= CHECKPOINT_INTERVAL:
+                        write_checkpoint(f, progress, completed)
+        finally:
+            # A run that stopped early leaves gaps in the order; keep the pages
+            # already scraped past them, since --resume only needs their URLs
+            for index in sorted(pending):
+                write_page(pending[index])
+            write_checkpoint(f, progress, completed)
+
+
+async def scrape_pages(session: aiohttp.ClientSession, limiter: HostRateLimiter,
+                       robots: Optional[RobotsRules], urls: List[str], output_filename: str,
+                       concurrency: int, append: bool, head_only: bool, output_format: str) -> None:
+    """
+    Scrape pages concurrently and write their metadata to the output file.
+    
+    Fetching, parsing and writing run as a pipeline: fetchers hand raw pages
+    to parser tasks over a bounded queue, the parsers run extract_metadata in
+    a process pool so parsing overlaps with network I/O, and a single writer
+    task saves the results.
+    
+    Args:
+        session: Shared HTTP session used for the requests
+        limiter: Per-host rate limiter for the requests
+        robots: robots.txt rules to check pages against, or None to fetch every page
+        urls: URLs of the pages to scrape
+        output_filename: Path of the file to write results to
+        concurrency: Maximum number of pages fetched at the same time
+        append: Whether to add to the results of an interrupted run
+        head_only: Whether to skip downloading pages whose canonical URL is in a Link header
+        output_format: 'text' for the readable report or 'jsonl' for JSON Lines
+    """
+    pages: asyncio.Queue = asyncio.Queue(maxsize=PARSE_QUEUE_SIZE)
+    results: asyncio.Queue = asyncio.Queue()
+    semaphore = asyncio.Semaphore(concurrency)
+    loop = asyncio.get_running_loop()
+    total = len(urls)
+    
+    async def scrape(index: int, url: str) -> None:
+        async with semaphore:
+            print(f"Scraping {index}/{total}: {url}")
+            
+            try:
+                if robots and not await robots.can_fetch(url):
+                    print(f"Skipping {url}: disallowed by robots.txt")
+                    await results.put((index, {
+                        'url': url,
+                        'canonical': '',
+                        'title': 'SKIPPED: Disallowed by robots.txt',
+                        'description': ''
+                    }))
+                    return
+                
+                if head_only:
+                    canonical = await fetch_canonical_header(session, limiter, url)
+                    if canonical:
+                        await results.put((index, {
+                            'url': url,
+                            'canonical': canonical,
+                            'title': '',
+                            'description': ''
+                        }))
+                        return
+                
+                html = await fetch_page(session, limiter, url)
+            except Exception as e:
+                # Pass the page on as unfetched so the writer still gets a
+                # record for this position
+                print(f"Error scraping {url}: {e}")
+                html = None
+        await pages.put((index, url, html))
+    
+    async def parse(pool: ProcessPoolExecutor) -> None:
+        while True:
+            page = await pages.get()
+            if page is None:
+                break
+            index, url, html = page
+            try:
+                metadata = await loop.run_in_executor(pool, extract_metadata, url, html)
+            except Exception as e:
+                print(f"Error parsing {url}: {e}")
+                metadata = {
+                    'url': url,
+                    'canonical': '',
+                    'title': 'ERROR: Could not parse page',
+                    'description': ''
+                }
+                # A broken pool fails every later page as well, so stop the run
+                if isinstance(e, BrokenProcessPool):
+                    await results.put((index, metadata))
+                    raise
+            await results.put((index, metadata))
+    
+    async def feed(fetchers: List[asyncio.Task], parser_count: int) -> None:
+        await asyncio.gather(*fetchers)
+        for _ in range(parser_count):
+            await pages.put(None)
+    
+    writer = asyncio.create_task(write_results(results, output_filename, append, output_format))
+    
+    try:
+        parser_count = os.cpu_count() or 1
+        # Spawn fresh workers rather than forking a process that already runs
+        # the event loop and the resolver's background thread
+        mp_context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(parser_count, mp_context=mp_context) as pool:
+            fetchers = [asyncio.create_task(scrape(i, url)) for i, url in enumerate(urls, 1)]
+            tasks = [
+                asyncio.create_task(feed(fetchers, parser_count)),
+                *(asyncio.create_task(parse(pool)) for _ in range(parser_count)),
+            ]
+            # Watch the parsers alongside the fetchers so a crashed parser
+            # stops the run instead of leaving fetchers blocked on a full queue
+            try:
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+                for task in done:
+                    task.result()
+            finally:
+                for task in (*fetchers, *tasks):
+                    task.cancel()
+                await asyncio.gather(*fetchers, *tasks, return_exceptions=True)
+    finally:
+        await results.put(None)
+        await writer
+    
+    # Every page is in the output, so there is nothing left to resume
+    os.remove(get_progress_filename(output_filename))
+
+
+async def run(args: argparse.Namespace) -> None:
+    """
+    Run the scraper with a single HTTP session for all requests.
+    
+    Args:
+        args: Parsed command line arguments
+    """
+    # Generate filename if not provided
+    if args.output:
+        output_filename = args.output
+    else:
+        extension = 'jsonl' if args.format == 'jsonl' else 'txt'
+        output_filename = generate_filename(args.sitemap_url, extension)
+    
+    # Add delay between requests to the same host to be respectful
+    limiter = HostRateLimiter(args.delay)
+    
+    async with create_session(args.concurrency, limiter, use_cache=not args.no_cache) as session:
+        robots = None if args.ignore_robots else RobotsRules(session, limiter)
+        
+        print(f"Fetching sitemap from: {args.sitemap_url}")
+        urls = await parse_sitemap(
+            session, limiter, args.sitemap_url, args.page_count, args.concurrency
+        )
+        
+        if not urls:
+            print("No URLs found in sitemap")
+            sys.exit(1)
+        
+        print(f"Found {len(urls)} URLs in sitemap")
+        
+        # Limit to requested number of pages
+        urls_to_scrape = urls[:args.page_count]
+        
+        # Skip pages an interrupted run already saved
+        completed = load_progress(output_filename) if args.resume else set()
+        if completed:
+            urls_to_scrape = [url for url in urls_to_scrape if url not in completed]
+            print(f"Resuming: {len(completed)} pages already saved")
+        
+        print(f"Scraping {len(urls_to_scrape)} pages...")
+        print(f"Output will be saved to: {output_filename}")
+        
+        # Create output directory if it doesn't exist
+        output_dir = os.path.dirname(output_filename)
+        if output_dir and not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        
+        await scrape_pages(session, limiter, robots, urls_to_scrape, output_filename, args.concurrency,
+                           append=bool(completed), head_only=args.head_only, output_format=args.format)
+    
+    print(f"\nResults saved to: {output_filename}")
+    print(f"Scraped {len(urls_to_scrape)} pages successfully")
 
 
 def main():
@@ -254,66 +998,55 @@ def main():
         '-o',
         help='Output file name (default: auto-generated with domain and timestamp)'
     )
+    parser.add_argument(
+        '--format',
+        '-f',
+        choices=['text', 'jsonl'],
+        default='text',
+        help='Output format: readable text report or JSON Lines (default: text)'
+    )
     parser.add_argument(
         '--delay',
         '-d',
         type=float,
         default=1.0,
-        help='Delay between requests in seconds (default: 1.0)'
+        help='Delay between requests to the same host in seconds (default: 1.0)'
+    )
+    parser.add_argument(
+        '--concurrency',
+        '-c',
+        type=int,
+        default=5,
+        help='Number of pages to fetch concurrently (default: 5)'
+    )
+    parser.add_argument(
+        '--head-only',
+        action='store_true',
+        help='Check the canonical URL with a HEAD request first and only download pages '
+             'without a canonical Link header'
+    )
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='Fetch every page from the network instead of using the local HTTP cache'
+    )
+    parser.add_argument(
+        '--ignore-robots',
+        action='store_true',
+        help='Scrape pages even if robots.txt disallows them'
+    )
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        help='Continue an interrupted run, appending to the file given with --output'
     )
     
     args = parser.parse_args()
     
-    # Generate filename if not provided
-    if args.output:
-        output_filename = args.output
-    else:
-        output_filename = generate_filename(args.sitemap_url)
-    
-    print(f"Fetching sitemap from: {args.sitemap_url}")
-    urls = parse_sitemap(args.sitemap_url)
-    
-    if not urls:
-        print("No URLs found in sitemap")
-        sys.exit(1)
-    
-    print(f"Found {len(urls)} URLs in sitemap")
-    
-    # Limit to requested number of pages
-    urls_to_scrape = urls[:args.page_count]
-    
-    print(f"Scraping {len(urls_to_scrape)} pages...")
-    print(f"Output will be saved to: {output_filename}")
+    if args.resume and not args.output:
+        parser.error('--resume requires --output')
     
-    # Create output directory if it doesn't exist
-    output_dir = os.path.dirname(output_filename)
-    if output_dir and not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-    
-    # Open file for writing and write in real-time
-    with open(output_filename, 'w', encoding='utf-8') as f:
-        for i, url in enumerate(urls_to_scrape, 1):
-            print(f"Scraping {i}/{len(urls_to_scrape)}: {url}")
-            
-            metadata = extract_metadata(url)
-            formatted_output = format_output(metadata)
-            
-            # Write to file immediately
-            f.write(formatted_output)
-            
-            # Add separator line between pages (except for the last page)
-            if i < len(urls_to_scrape):
-                f.write('\n\n')
-            
-            # Flush to ensure data is written immediately
-            f.flush()
-            
-            # Add delay between requests to be respectful
-            if i < len(urls_to_scrape):
-                time.sleep(args.delay)
-    
-    print(f"\nResults saved to: {output_filename}")
-    print(f"Scraped {len(urls_to_scrape)} pages successfully")
+    asyncio.run(run(args))
 
 
 if __name__ == "__main__":